@@ -1,9 +1,16 @@
 # clever_spider.py
 import re
 import scrapy
+from lxml import etree
 from urllib.parse import urljoin, urlparse
 from ..items import ProductItem
 
+_WS_RE = re.compile(r'\s+')
+_NUM_RE = re.compile(r'([\d\.,]+)')
+_PAGE_RE = re.compile(r'[?&]page=(\d+)')
+_PID_RE = re.compile(r'Produkt ID:\s*([A-Za-z0-9\-]+)')
+_UID_RE = re.compile(r'(\d+)(?:/)?$')
+
 class CleverSpider(scrapy.Spider):
     name = "clever"
     allowed_domains = ["cleverleben.at"]
@@ -12,6 +19,19 @@ class CleverSpider(scrapy.Spider):
         "ROBOTSTXT_OBEY": True,  # you can override from command line
     }
 
+    # Product detail XPaths, compiled once and run against response.selector.root;
+    # smart_strings=False returns plain str (nothing here needs .getparent())
+    _XP_NAME = etree.XPath('//h1/text()', smart_strings=False)
+    _XP_BODY_TEXT = etree.XPath('//body//text()', smart_strings=False)
+    _XP_DESC = etree.XPath('//h1/following::p[1]/text()', smart_strings=False)
+    _XP_DESC_FIRST_P = etree.XPath('//p[normalize-space()][1]/text()', smart_strings=False)
+    _XP_DESC_CLEVER = etree.XPath('//h2[contains(., "Einfach clever")]/preceding::p[1]/text()', smart_strings=False)
+    _XP_PID = etree.XPath('//text()[contains(., "Produkt ID:")]', smart_strings=False)
+    _XP_INGREDIENTS = etree.XPath('//text()[starts-with(normalize-space(), "Zutaten:")]', smart_strings=False)
+    _XP_DETAILS = etree.XPath('//*[self::h2 or self::h3][normalize-space()="Produktinformation"]/following::*[normalize-space()][1]/text()', smart_strings=False)
+    _XP_OG_IMAGE = etree.XPath('//meta[@property="og:image"]/@content', smart_strings=False)
+    _XP_CDN_IMAGES = etree.XPath('//img[contains(@src, "commercetools")]/@src', smart_strings=False)
+
     def __init__(self, max_items=1000, *args, **kwargs):
         super().__init__(*args, **kwargs)
         try:
@@ -32,7 +52,7 @@ class CleverSpider(scrapy.Spider):
         if txt is None:
             return None
         # remove newlines/tabs and collapse spaces
-        return re.sub(r'\s+', ' ', txt).strip()
+        return _WS_RE.sub(' ', txt).strip()
 
     def _extract_first(self, sel_list):
         """
@@ -57,12 +77,14 @@ class CleverSpider(scrapy.Spider):
     # ---------- Entry ----------
     def parse(self, response):
         # 1) From start page, go to the 4 main categories
-        cat_links = response.css('a[href*="/lebensmittel"]::attr(href)').getall()
-        cat_links += response.css('a[href*="/getr"]::attr(href)').getall()
-        cat_links += response.css('a[href*="/haushalt"]::attr(href)').getall()
-        cat_links += response.css('a[href*="/tier"]::attr(href)').getall()
-        # Also catch any direct "produkte/*"
-        cat_links += response.css('a[href^="/produkte/"]::attr(href)').getall()
+        # (plus any direct "produkte/*"), one combined query = one DOM walk
+        cat_links = response.css(
+            'a[href*="/lebensmittel"]::attr(href), '
+            'a[href*="/getr"]::attr(href), '
+            'a[href*="/haushalt"]::attr(href), '
+            'a[href*="/tier"]::attr(href), '
+            'a[href^="/produkte/"]::attr(href)'
+        ).getall()
 
         for href in dict.fromkeys(cat_links):
             url = self._abs(response, href)
@@ -99,12 +121,12 @@ class CleverSpider(scrapy.Spider):
             # fallback: ?page= links
             pages = response.css('a[href*="?page="]::attr(href)').getall()
             cur = 1
-            m = re.search(r'[?&]page=(\d+)', response.url)
+            m = _PAGE_RE.search(response.url)
             if m:
                 cur = int(m.group(1))
             cand = None
             for p in sorted(set(pages)):
-                m2 = re.search(r'[?&]page=(\d+)', p)
+                m2 = _PAGE_RE.search(p)
                 if m2 and int(m2.group(1)) == cur + 1:
                     cand = p
                     break
@@ -119,18 +141,22 @@ class CleverSpider(scrapy.Spider):
             return
 
         item = ProductItem()
-        item['product_url'] = response.url
+        item['product_url'] = self._clean_text(response.url)
+        root = response.selector.root
 
         # Name
-        name = self._extract_first(response.xpath('//h1/text()'))
+        name = self._extract_first(self._XP_NAME(root))
         if not name:
             name = self._extract_first(response.css('h1::text'))
         item['product_name'] = name
 
         # Price (raw with currency if present near top, first occurrence)
-        price = self._extract_first(response.xpath('//*[contains(text(), "€")][1]/text()'))
-        if not price:
-            price = self._extract_first(response.css('*:contains("€")::text'))
+        # one compiled text-node scan + Python `in` instead of an XPath contains() probe
+        price = None
+        for t in self._XP_BODY_TEXT(root):
+            if '€' in t:
+                price = self._clean_text(t)
+                break
         item['price'] = price
 
         # Currency
@@ -139,7 +165,7 @@ class CleverSpider(scrapy.Spider):
         # normalize regular_price (decimal dot)
         if price:
             # extract number-like portion, allow comma as decimal
-            m = re.search(r'([\d\.,]+)', price)
+            m = _NUM_RE.search(price)
             if m:
                 raw = m.group(1)
                 # replace comma by dot, then if multiple dots/commas keep last as decimal
@@ -151,53 +177,41 @@ class CleverSpider(scrapy.Spider):
             item['regular_price'] = None
 
         # Description (first paragraph)
-        desc = self._extract_first(response.xpath('//h1/following::p[1]/text()'))
+        desc = self._extract_first(self._XP_DESC(root))
         if not desc:
-            desc = self._extract_first(response.xpath('//p[normalize-space()][1]/text()'))
+            desc = self._extract_first(self._XP_DESC_FIRST_P(root))
         if not desc:
-            desc = self._extract_first(response.xpath('//h2[contains(., "Einfach clever")]/preceding::p[1]/text()'))
+            desc = self._extract_first(self._XP_DESC_CLEVER(root))
         item['product_description'] = desc
 
         # Product ID "Produkt ID: 27-19989"
-        pid_text = self._extract_first(response.xpath('//text()[contains(., "Produkt ID:")]'))
+        pid_text = self._extract_first(self._XP_PID(root))
         product_id = None
         if pid_text:
-            m = re.search(r'Produkt ID:\s*([A-Za-z0-9\-]+)', pid_text)
+            m = _PID_RE.search(pid_text)
             if m:
                 product_id = m.group(1)
         item['product_id'] = product_id
 
         # unique_id from URL trailing digits
-        m = re.search(r'(\d+)(?:/)?$', urlparse(response.url).path)
+        m = _UID_RE.search(urlparse(response.url).path)
         item['unique_id'] = m.group(1) if m else None
 
         # Ingredients: line that starts with "Zutaten:"
-        ingredients = self._extract_first(response.xpath('//text()[starts-with(normalize-space(), "Zutaten:")]'))
+        ingredients = self._extract_first(self._XP_INGREDIENTS(root))
         item['ingredients'] = ingredients
 
         # Details: under "Produktinformation" section, first text line
-        details = self._extract_first(response.xpath('//*[self::h2 or self::h3][normalize-space()="Produktinformation"]/following::*[normalize-space()][1]/text()'))
+        details = self._extract_first(self._XP_DETAILS(root))
         item['details'] = details
 
         # Images: og:image + any commercetools CDN images
-        imgs = response.xpath('//meta[@property="og:image"]/@content').getall()
-        imgs += response.xpath('//img[contains(@src, "commercetools")]/@src').getall()
-        # Normalize and absolutize + unique
-        abs_imgs = []
-        for u in imgs:
-            if not u:
-                continue
-            u_abs = urljoin(response.url, u)
-            if u_abs not in abs_imgs:
-                abs_imgs.append(u_abs)
+        imgs = self._XP_OG_IMAGE(root) + self._XP_CDN_IMAGES(root)
+        # Normalize and absolutize + unique (dict keeps first-seen order)
+        abs_imgs = list(dict.fromkeys(urljoin(response.url, u) for u in imgs if u))
         item['images'] = abs_imgs
         # also set singular name for compatibility
-        item['image'] = abs_imgs[0] if abs_imgs else None
-
-        # final cleanup: ensure no weird newlines etc (already done by helpers where applicable)
-        for k, v in list(item.items()):
-            if isinstance(v, str):
-                item[k] = self._clean_text(v)
+        item['image'] = self._clean_text(abs_imgs[0]) if abs_imgs else None
 
         self.item_count += 1
         yield item